@@ -1,18 +1,92 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import sqlite3
-import requests
+import httpx
 import json
 import re
-from typing import Dict, List, Any
+import functools
+import itertools
+import time
+import asyncio
+from typing import Dict, List, Any, Optional, AsyncIterator
 import logging
+import queue
+from contextlib import contextmanager, asynccontextmanager
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="QueryGPT Local", version="1.0.0")
+# Prompt sent to the model; everything before the question only depends on the schema
+_PROMPT_TEMPLATE = """You are a SQL expert. Convert the following natural language query to SQL.
+
+{schema_info}
+
+Business Rules:
+{business_rules}
+
+Natural Language Query: """
+
+# Business rules as (rule, words in a question that call for it, tables it refers to)
+_BUSINESS_RULES = (
+    ("Use proper joins between tables", (), ()),
+    ("Always include meaningful column aliases", (), ()),
+    ("For revenue calculations, multiply quantity by unit_price", ("revenue",), ("order_items",)),
+    ("Active customers have is_active = 1", ("active",), ("customers",)),
+    ("Completed orders have status = 'completed'", ("completed",), ("orders",)),
+)
+
+_PROMPT_SUFFIX = """
+
+Generate only the SQL query, no explanations. The query should be valid SQLite syntax.
+
+SQL Query:"""
+
+# Column name parts that are too common in questions to tell tables apart
+_GENERIC_SCHEMA_WORDS = frozenset(("id", "is", "name", "date", "first", "last"))
+
+# Precompiled patterns used when cleaning up LLM output
+_CODEBLOCK_RE = re.compile(r"```[\s\S]*?```")
+_SQL_START_RE = re.compile(r"^[ \t]*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.IGNORECASE | re.MULTILINE)
+_SEMI_RE = re.compile(r";+$")
+# Values in a question that change the SQL: numbers, quoted strings and capitalized words (USA, Canada, July)
+_LITERAL_RE = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"|\b[A-Z][\w-]*")
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+# Filler words that paraphrases of the same question are free to add, drop or swap
+_STOPWORDS = frozenset((
+    "a", "an", "the", "of", "in", "on", "for", "to", "from", "by", "with", "and", "or", "at", "as",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "have", "has", "had",
+    "i", "me", "my", "we", "us", "our", "you", "your", "it", "its", "they", "them", "their",
+    "what", "which", "who", "how", "that", "this", "these", "those", "there",
+    "show", "list", "give", "get", "find", "display", "return", "tell", "see", "want", "need",
+    "please", "can", "could", "would", "will", "all", "each", "every",
+))
+
+# Non-SQLite functions and their SQLite-compatible replacements
+_SQLITE_REWRITES = (
+    (re.compile(r"\bYEAR\s*\(\s*([^)]+?)\s*\)", re.IGNORECASE), r"strftime('%Y', \1)"),
+    (re.compile(r"\bMONTH\s*\(\s*([^)]+?)\s*\)", re.IGNORECASE), r"strftime('%m', \1)"),
+    (re.compile(r"\bDAY\s*\(\s*([^)]+?)\s*\)", re.IGNORECASE), r"strftime('%d', \1)"),
+    (re.compile(r"\bNOW\s*\(\s*\)", re.IGNORECASE), r"CURRENT_TIMESTAMP"),
+    (re.compile(r"\bCURDATE\s*\(\s*\)", re.IGNORECASE), r"DATE('now')"),
+    (re.compile(r"\bGETDATE\s*\(\s*\)", re.IGNORECASE), r"CURRENT_TIMESTAMP"),
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Preload the model in the background on startup, release resources on shutdown"""
+    # Not awaited, so the server (and /api/health) is available while the model loads
+    warm_up_task = asyncio.create_task(query_engine.warm_up())
+    yield
+    warm_up_task.cancel()
+    await query_engine.close()
+
+app = FastAPI(title="QueryGPT Local", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware for frontend communication
 app.add_middleware(
@@ -34,197 +108,555 @@ class QueryResponse(BaseModel):
     row_count: int
     execution_time: float
 
+def _clean_sql_query(text: str) -> str:
+    """Extract clean SQL query from generated text"""
+    # Remove common prefixes and clean up
+    text = text.strip()
+    text = _CODEBLOCK_RE.sub(lambda m: m.group(0).replace("```", "").strip(), text)
+
+    # Find the first line that starts with a SQL keyword
+    sql_lines = []
+    match = _SQL_START_RE.search(text)
+    if match:
+        for line in text[match.start():].split('\n'):
+            line = line.strip()
+            # Continue collecting SQL lines
+            if line and not line.startswith('--') and not line.startswith('#'):
+                sql_lines.append(line)
+            elif not line:  # Empty line might indicate end of SQL
+                break
+
+    sql_query = ' '.join(sql_lines)
+
+    # Clean up common issues
+    sql_query = _SEMI_RE.sub(';', sql_query)  # Remove multiple semicolons
+    sql_query = sql_query.strip()
+
+    # Auto-convert non-SQLite functions to SQLite-compatible syntax
+    for pattern, replacement in _SQLITE_REWRITES:
+        sql_query = pattern.sub(replacement, sql_query)
+
+    if not sql_query:
+        sql_query = text  # Fallback to original text
+
+    return sql_query
+
+@functools.lru_cache(maxsize=1024)
+def _extract_sql_query(text: str) -> str:
+    """Cached _clean_sql_query for complete model outputs, which repeat for repeated questions"""
+    return _clean_sql_query(text)
+
+def _singular(word: str) -> str:
+    """Crude singular form so 'customers' in a question matches a 'customer' column"""
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+def _to_arrow_array(values) -> pa.Array:
+    """Convert one result column to Arrow; SQLite allows mixed types, which become strings"""
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+def _connect_tables(tables: set, related_tables: Dict[str, set]) -> set:
+    """Add the tables on the shortest foreign-key path between each pair of tables"""
+    connected = set(tables)
+    for start in tables:
+        # Breadth-first search over foreign keys, remembering how each table was reached
+        parents = {start: None}
+        frontier = [start]
+        while frontier:
+            next_frontier = []
+            for table in frontier:
+                for neighbour in related_tables.get(table, ()):
+                    if neighbour not in parents:
+                        parents[neighbour] = table
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        
+        for end in tables:
+            table = end if end in parents else None
+            while table is not None:
+                connected.add(table)
+                table = parents[table]
+    return connected
+
+# Statement actions allowed for generated SQL; everything else (writes, DDL, PRAGMA, ATTACH) is denied
+_ALLOWED_SQL_ACTIONS = frozenset((sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE))
+
+def _select_only_authorizer(action, arg1, arg2, db_name, trigger_name):
+    """SQLite authorizer callback that only permits read-only queries"""
+    return sqlite3.SQLITE_OK if action in _ALLOWED_SQL_ACTIONS else sqlite3.SQLITE_DENY
+
+class IntentCache:
+    """In-memory cache mapping query embeddings to previously generated SQL"""
+
+    # Similar enough to return cached SQL directly; between the two thresholds
+    # the questions must also use the same non-stopword words
+    AUTO_RETURN_THRESHOLD = 0.9
+    VERIFY_THRESHOLD = 0.85
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._vectors: Optional[np.ndarray] = None  # one normalized embedding per row
+        self._entries: List[Dict[str, Any]] = []
+        self._schema_version: Optional[int] = None
+
+    @staticmethod
+    def _literals(text: str) -> tuple:
+        """Values in a query; paraphrases with different limits, years or names must not share SQL"""
+        text = text.strip()
+        literals = []
+        for match in _LITERAL_RE.finditer(text):
+            literal = match.group(0)
+            # A capitalized first word is just the start of the sentence, unless it is an acronym
+            if match.start() == 0 and literal[0].isupper() and not literal.isupper():
+                continue
+            literals.append(literal.strip("'\"").lower())
+        return tuple(sorted(literals))
+
+    @staticmethod
+    def _words(text: str) -> frozenset:
+        """Lowercased non-stopword words of a query, so "usa" vs "canada" or "most" vs "least" don't match"""
+        return frozenset(_singular(word) for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS)
+
+    def _check_schema(self, schema_version: int):
+        # Cached SQL is only valid for the schema it was generated against
+        if schema_version != self._schema_version:
+            self._vectors = None
+            self._entries = []
+            self._schema_version = schema_version
+
+    def lookup(self, embedding: np.ndarray, natural_query: str, schema_version: int) -> Optional[str]:
+        """Return cached SQL for a sufficiently similar query, or None on a miss"""
+        self._check_schema(schema_version)
+        if self._vectors is None:
+            return None
+
+        similarities = np.dot(self._vectors, embedding)
+        best = int(np.argmax(similarities))
+        score = float(similarities[best])
+        entry = self._entries[best]
+
+        # Embeddings barely move when only a value changes ("top 5" vs "top 10"),
+        # so a hit always requires the same literals, however similar the questions are
+        if score < self.VERIFY_THRESHOLD or entry["literals"] != self._literals(natural_query):
+            return None
+        if score < self.AUTO_RETURN_THRESHOLD and entry["words"] != self._words(natural_query):
+            return None
+        return entry["sql"]
+
+    def add(self, embedding: np.ndarray, natural_query: str, sql_query: str, schema_version: int):
+        """Store SQL generated for a query embedding"""
+        self._check_schema(schema_version)
+        if len(self._entries) >= self.max_entries:
+            # Drop the oldest entry
+            self._entries.pop(0)
+            self._vectors = self._vectors[1:]
+
+        self._entries.append({
+            "sql": sql_query,
+            "literals": self._literals(natural_query),
+            "words": self._words(natural_query),
+        })
+        row = embedding.reshape(1, -1)
+        self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+
 class QueryGPTEngine:
-    def __init__(self, db_path: str = "database/querygpt.db"):
+    def __init__(self, db_path: str = "database/querygpt.db", pool_size: int = 4):
         self.db_path = db_path
+        self._pool = self._create_pool(pool_size)
+        # Schema checks run on the event loop, so they get their own connection rather than
+        # blocking on a pool that may be fully checked out by running queries
+        self._schema_conn = self._connect_read_only()
         self.ollama_url = "http://localhost:11434/api/generate"
-        self.schema_info = self._get_schema_info()
+        self.ollama_embed_url = "http://localhost:11434/api/embed"
+        self.ollama_ps_url = "http://localhost:11434/api/ps"
+        # 4-bit quantized weights roughly double decode throughput over the default tag
+        self.model = "codellama:7b-instruct-q4_K_M"
+        # How long Ollama keeps the model resident after a request, avoiding cold loads
+        self.keep_alive = "30m"
+        self.embedding_model = "nomic-embed-text"
+        # Shared async client so concurrent queries reuse keep-alive connections to Ollama
+        self._http = httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_keepalive_connections=16))
+        # Introspection reruns only when PRAGMA schema_version changes
+        self._schema_cache = self._build_schema_cache(self._get_schema_version())
+        self.intent_cache = IntentCache()
     
-    def _get_schema_info(self) -> str:
-        """Extract database schema information"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _build_schema_cache(self, schema_version: int) -> Dict[str, Any]:
+        """Introspect the schema and precompute what prompt construction needs from it"""
+        table_docs, table_columns = self._introspect_schema()
+        
+        # Words that point a question at each table: its name and its column names and their parts.
+        # Key columns aren't split, otherwise 'customer_id' would tie every question about customers to orders
+        table_vocab = {}
+        for table_name, columns in table_columns.items():
+            words = {table_name}
+            for column in columns:
+                words.add(column)
+                if not column.endswith("_id"):
+                    words.update(column.split("_"))
+            table_vocab[table_name] = {_singular(word) for word in words} - _GENERIC_SCHEMA_WORDS
         
-        # Get all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
+        return {
+            "version": schema_version,
+            "schema_info": "Database Schema:\n\n" + "".join(table_docs.values()),
+            "table_docs": table_docs,
+            "table_vocab": table_vocab,
+            "related_tables": self._get_related_tables(),
+            "prompt_prefixes": {},  # prompt prefix per subset of tables
+        }
+    
+    def _current_schema_cache(self) -> Dict[str, Any]:
+        """Return the schema cache, refreshing it after schema changes"""
+        schema_version = self._get_schema_version()
+        if schema_version != self._schema_cache["version"]:
+            self._schema_cache = self._build_schema_cache(schema_version)
+        return self._schema_cache
+    
+    @property
+    def schema_info(self) -> str:
+        """Schema description, re-introspected only after a schema change"""
+        return self._current_schema_cache()["schema_info"]
+    
+    def _prompt_prefix(self, natural_query: str) -> str:
+        """Prompt text preceding the question, describing only the tables it is likely about"""
+        schema_cache = self._current_schema_cache()
+        table_vocab = schema_cache["table_vocab"]
+        
+        query_words = {_singular(word) for word in _WORD_RE.findall(natural_query.lower())}
+        matched = {table for table, vocab in table_vocab.items() if vocab & query_words}
+        # Tables needed by business rules the question calls for, e.g. revenue needs order_items
+        for _, triggers, rule_tables in _BUSINESS_RULES:
+            if query_words.intersection(triggers):
+                matched.update(table for table in rule_tables if table in table_vocab)
+        
+        # Joins usually need the tables linked by foreign keys as well, and every table
+        # on the foreign-key path between two matched tables
+        related_tables = schema_cache["related_tables"]
+        for table in list(matched):
+            matched |= related_tables.get(table, set())
+        matched = _connect_tables(matched, related_tables)
+        
+        # Fall back to the full schema when nothing matches
+        key = tuple(table for table in schema_cache["table_docs"] if table in matched) or None
+        prefixes = schema_cache["prompt_prefixes"]
+        if key not in prefixes:
+            if key is None:
+                schema_info = schema_cache["schema_info"]
+                rules = [rule for rule, _, _ in _BUSINESS_RULES]
+            else:
+                schema_info = "Database Schema:\n\n" + "".join(schema_cache["table_docs"][table] for table in key)
+                # Leave out rules about tables that aren't in the prompt
+                rules = [rule for rule, _, rule_tables in _BUSINESS_RULES if set(rule_tables) <= matched]
+            prefixes[key] = _PROMPT_TEMPLATE.format(
+                schema_info=schema_info,
+                business_rules="\n".join(f"- {rule}" for rule in rules)
+            )
+        return prefixes[key]
+    
+    def _create_pool(self, size: int) -> queue.Queue:
+        """Open long-lived read-only SQLite connections shared across requests"""
+        # WAL is persisted in the database file, so enabling it once is enough;
+        # it needs write access, which the pooled connections don't have
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.close()
         
-        schema_description = "Database Schema:\n\n"
+        pool = queue.Queue(maxsize=size)
+        for _ in range(size):
+            conn = self._connect_read_only()
+            # Security check - pooled connections only run generated SQL, so SQLite
+            # rejects anything but reads while compiling every statement on them
+            conn.set_authorizer(_select_only_authorizer)
+            pool.put(conn)
+        return pool
+    
+    def _connect_read_only(self) -> sqlite3.Connection:
+        """Open a read-only connection usable from any thread"""
+        read_only_uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(read_only_uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA cache_size=-64000;")  # 64 MB page cache per connection
+        return conn
+    
+    @contextmanager
+    def _connection(self):
+        """Check a connection out of the pool for the duration of a block"""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+    
+    def _get_schema_version(self) -> int:
+        """Return SQLite's schema version counter, bumped on every schema change"""
+        return self._schema_conn.execute("PRAGMA schema_version;").fetchone()[0]
+    
+    async def _embed_query(self, natural_query: str) -> Optional[np.ndarray]:
+        """Embed a natural language query via Ollama; None if embeddings are unavailable"""
+        payload = {"model": self.embedding_model, "input": natural_query}
         
-        for (table_name,) in tables:
-            schema_description += f"Table: {table_name}\n"
+        try:
+            response = await self._http.post(self.ollama_embed_url, json=payload)
+            response.raise_for_status()
             
-            # Get column information
-            cursor.execute(f"PRAGMA table_info({table_name});")
-            columns = cursor.fetchall()
+            embedding = np.asarray(response.json()["embeddings"][0], dtype=np.float32)
+            norm = np.linalg.norm(embedding)
+            return embedding / norm if norm else None
             
-            for col in columns:
-                col_name, col_type, not_null, default_val, pk = col[1], col[2], col[3], col[4], col[5]
-                schema_description += f"  - {col_name} ({col_type})"
+        except (httpx.HTTPError, KeyError, IndexError) as e:
+            logger.warning(f"Embedding unavailable, skipping intent cache: {e}")
+            return None
+    
+    def _introspect_schema(self) -> tuple:
+        """Extract database schema information as (description per table, column names per table)"""
+        cursor = self._schema_conn.cursor()
+        
+        # Get every column of every table in one query, skipping SQLite internals such as sqlite_stat1
+        cursor.execute("""
+            SELECT m.name, p.name, p.type, p."notnull", p.pk
+            FROM sqlite_master m JOIN pragma_table_info(m.name) p
+            WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+            ORDER BY m.rowid, p.cid;
+        """)
+        columns = cursor.fetchall()
+        
+        table_columns = {
+            table_name: [col[1] for col in rows]
+            for table_name, rows in itertools.groupby(columns, key=lambda col: col[0])
+        }
+        sample_rows = self._get_sample_rows(cursor, table_columns)
+        
+        table_docs = {}
+        for table_name, rows in itertools.groupby(columns, key=lambda col: col[0]):
+            parts = [f"Table: {table_name}\n"]
+            
+            for _, col_name, col_type, not_null, pk in rows:
+                parts.append(f"  - {col_name} ({col_type})")
                 if pk:
-                    schema_description += " [PRIMARY KEY]"
+                    parts.append(" [PRIMARY KEY]")
                 if not_null:
-                    schema_description += " [NOT NULL]"
-                schema_description += "\n"
+                    parts.append(" [NOT NULL]")
+                parts.append("\n")
             
-            # Get sample data
-            cursor.execute(f"SELECT * FROM {table_name} LIMIT 3;")
-            sample_data = cursor.fetchall()
-            if sample_data:
-                schema_description += f"  Sample data: {sample_data[0]}\n"
+            if sample_rows.get(table_name):
+                parts.append(f"  Sample data: {sample_rows[table_name]}\n")
             
-            schema_description += "\n"
+            parts.append("\n")
+            table_docs[table_name] = "".join(parts)
         
-        conn.close()
-        return schema_description
+        return table_docs, table_columns
     
-    def _generate_sql_with_ollama(self, natural_query: str) -> str:
-        """Generate SQL using local Ollama model"""
-        prompt = f"""You are a SQL expert. Convert the following natural language query to SQL.
-
-{self.schema_info}
-
-Business Rules:
-- Use proper joins between tables
-- Always include meaningful column aliases
-- For revenue calculations, multiply quantity by unit_price
-- Active customers have is_active = 1
-- Completed orders have status = 'completed'
-
-Natural Language Query: {natural_query}
-
-Generate only the SQL query, no explanations. The query should be valid SQLite syntax.
-
-SQL Query:"""
+    def _get_sample_rows(self, cursor, table_columns: Dict[str, List[str]]) -> Dict[str, Optional[tuple]]:
+        """Fetch the first row of every table in one UNION ALL query"""
+        if not table_columns:
+            return {}
+        
+        # Tables have different columns, so each row is packed into a JSON array (BLOBs as hex)
+        selects = []
+        for table_name, columns in table_columns.items():
+            values = ", ".join(
+                f"""CASE WHEN typeof("{col}") = 'blob' THEN hex("{col}") ELSE "{col}" END""" for col in columns
+            )
+            selects.append(f'SELECT ?, (SELECT json_array({values}) FROM "{table_name}" LIMIT 1)')
+        
+        cursor.execute(" UNION ALL ".join(selects), list(table_columns))
+        return {
+            table_name: tuple(json.loads(row)) if row is not None else None
+            for table_name, row in cursor.fetchall()
+        }
+    
+    def _get_related_tables(self) -> Dict[str, set]:
+        """Map each table to the tables it shares a foreign key with, in either direction"""
+        references = self._schema_conn.execute("""
+            SELECT m.name, f."table"
+            FROM sqlite_master m JOIN pragma_foreign_key_list(m.name) f
+            WHERE m.type = 'table';
+        """).fetchall()
+        
+        related = {}
+        for table_name, referenced in references:
+            related.setdefault(table_name, set()).add(referenced)
+            related.setdefault(referenced, set()).add(table_name)
+        return related
+    
+    async def warm_up(self):
+        """Load the model into memory ahead of the first query"""
+        # An empty prompt makes Ollama load the model without generating anything
+        payload = {"model": self.model, "prompt": "", "stream": False, "keep_alive": self.keep_alive}
+        
+        try:
+            response = await self._http.post(self.ollama_url, json=payload)
+            response.raise_for_status()
+            logger.info(f"Model {self.model} loaded")
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not preload model {self.model}: {e}")
+    
+    async def is_model_loaded(self) -> Optional[bool]:
+        """Check via Ollama's /api/ps whether the model is currently resident, None if Ollama doesn't answer"""
+        try:
+            # Short timeout, the health check must not hang on a busy or stopped Ollama
+            response = await self._http.get(self.ollama_ps_url, timeout=1)
+            response.raise_for_status()
+            return any(m.get("name") == self.model for m in response.json().get("models", []))
+        except httpx.HTTPError:
+            return None
+    
+    async def _stream_sql_with_ollama(self, natural_query: str) -> AsyncIterator[str]:
+        """Yield tokens from the local Ollama model until a complete SQL statement is generated"""
+        prompt = self._prompt_prefix(natural_query) + natural_query + _PROMPT_SUFFIX
 
         payload = {
-            "model": "codellama:7b",
+            "model": self.model,
             "prompt": prompt,
-            "stream": False,
+            "stream": True,
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": 0.1,
                 "top_p": 0.9,
-                "num_ctx": 2048
+                "num_ctx": 1024,  # the schema prompt is ~500 tokens; a smaller KV cache decodes faster
+                "num_predict": 128  # SQL answers are short
             }
         }
         
         try:
-            response = requests.post(self.ollama_url, json=payload, timeout=60)
-            response.raise_for_status()
-            
-            result = response.json()
-            generated_text = result['response']
+            async with self._http.stream("POST", self.ollama_url, json=payload) as response:
+                response.raise_for_status()
+                
+                generated_text = ""
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise httpx.HTTPError(chunk["error"])
+                    
+                    token = chunk.get("response", "")
+                    if token:
+                        generated_text += token
+                        yield token
+                    
+                    # Stop decoding once the statement is complete; closing the stream cancels generation
+                    if chunk.get("done") or (";" in token and self._is_complete_statement(generated_text)):
+                        return
             
-            # Extract SQL query from response
-            sql_query = self._extract_sql_query(generated_text)
-            return sql_query
-            
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Error calling Ollama API: {e}")
             raise HTTPException(status_code=500, detail="Failed to generate SQL query")
     
-    def _extract_sql_query(self, text: str) -> str:
-        """Extract clean SQL query from generated text"""
-        # Remove common prefixes and clean up
-        text = text.strip()
-        text = re.sub(r"```[\s\S]*?```", lambda m: m.group(0).replace("```", "").strip(), text)
-        
-        # Look for SQL keywords to find the start of the query
-        sql_keywords = ['SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE']
-        
-        lines = text.split('\n')
-        sql_lines = []
-        found_sql = False
-        
-        for line in lines:
-            line = line.strip()
-            if not found_sql:
-                # Check if line starts with SQL keyword
-                if any(line.upper().startswith(keyword) for keyword in sql_keywords):
-                    found_sql = True
-                    sql_lines.append(line)
-            else:
-                # Continue collecting SQL lines
-                if line and not line.startswith('--') and not line.startswith('#'):
-                    sql_lines.append(line)
-                elif not line:  # Empty line might indicate end of SQL
-                    break
-        
-        sql_query = ' '.join(sql_lines)
-        
-        # Clean up common issues
-        sql_query = re.sub(r';+$', ';', sql_query)  # Remove multiple semicolons
-        sql_query = sql_query.strip()
-
-        # Auto-convert non-SQLite functions to SQLite-compatible syntax
-        sql_query = re.sub(r"(?i)\bYEAR\s*\(\s*([^)]+?)\s*\)", r"strftime('%Y', \1)", sql_query)
-        sql_query = re.sub(r"(?i)\bMONTH\s*\(\s*([^)]+?)\s*\)", r"strftime('%m', \1)", sql_query)
-        sql_query = re.sub(r"(?i)\bDAY\s*\(\s*([^)]+?)\s*\)", r"strftime('%d', \1)", sql_query)
-        sql_query = re.sub(r"(?i)\bNOW\s*\(\s*\)", r"CURRENT_TIMESTAMP", sql_query)
-        sql_query = re.sub(r"(?i)\bCURDATE\s*\(\s*\)", r"DATE('now')", sql_query)
-        sql_query = re.sub(r"(?i)\bGETDATE\s*\(\s*\)", r"CURRENT_TIMESTAMP", sql_query)
-        
-        if not sql_query:
-            sql_query = text  # Fallback to original text
-        
-        return sql_query
+    def _is_complete_statement(self, text: str) -> bool:
+        """Check whether generated text already holds a full SQL statement ending in ';'"""
+        if not _SQL_START_RE.search(text):
+            return False
+        # Partial outputs are never seen twice, so keep them out of the extraction cache
+        sql_query = _clean_sql_query(text)
+        # An odd number of quotes means the ';' is inside a string literal
+        return sql_query.endswith(';') and sql_query.count("'") % 2 == 0
+    
+    def _fetch_rows(self, sql_query: str) -> tuple:
+        """Execute SQL query against SQLite database, returning (column names, row tuples)"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            try:
+                # Only keep the first statement (before first ;)
+                cursor.execute(sql_query.strip().split(";", 1)[0])
+                
+                # Empty or comment-only text compiles to no statement at all
+                if cursor.description is None:
+                    raise ValueError("No SQL query was generated")
+                
+                columns = [description[0] for description in cursor.description]
+                return columns, cursor.fetchall()
+                
+            except Exception as e:
+                logger.error(f"SQL execution error: {e}")
+                raise HTTPException(status_code=400, detail=f"SQL execution failed: {str(e)}")
+            
+            finally:
+                cursor.close()
     
     def _execute_sql_query(self, sql_query: str) -> tuple:
-        """Execute SQL query against SQLite database"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable column access by name
-        cursor = conn.cursor()
+        """Execute SQL query and return rows as a list of dictionaries"""
+        columns, rows = self._fetch_rows(sql_query)
+        results = [dict(zip(columns, row)) for row in rows]
+        return results, len(results)
+    
+    def _execute_sql_query_arrow(self, sql_query: str) -> tuple:
+        """Execute SQL query and return the results as a columnar Arrow table"""
+        columns, rows = self._fetch_rows(sql_query)
+        # Transpose rows into one list per column (keeps duplicate column names intact)
+        column_values = list(zip(*rows)) if rows else [() for _ in columns]
+        table = pa.Table.from_arrays([_to_arrow_array(values) for values in column_values], names=columns)
+        return table, len(rows)
+    
+    def _generate_explanation(self, natural_query: str, sql_query: str, row_count: int) -> str:
+        """Generate a plain-text explanation of the query and results (no markdown code block)"""
+        parts = [
+            f"I converted your question '{natural_query}' into the following SQL query:\n\n",
+            sql_query,
+            f"\n\nThis query returned {row_count} rows.\n",
+        ]
+        if row_count:
+            parts.append("It likely selects, filters, and aggregates data as per your question.\n")
+        return "".join(parts)
+    
+    async def close(self):
+        """Close the shared HTTP client and all pooled connections"""
+        await self._http.aclose()
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        self._schema_conn.close()
+    
+    async def _resolve_sql_tokens(self, natural_query: str) -> AsyncIterator[tuple]:
+        """Yield ("token", text) while SQL is generated, then ("sql", (sql_query, on_success))"""
+        # Reuse SQL generated for an equivalent earlier question when possible
+        embedding = await self._embed_query(natural_query)
+        schema_version = self._get_schema_version()
+        if embedding is not None:
+            sql_query = self.intent_cache.lookup(embedding, natural_query, schema_version)
+            if sql_query is not None:
+                yield "sql", (sql_query, lambda: None)
+                return
         
-        try:
-            # Security check - only allow SELECT statements
-            if not sql_query.strip().upper().startswith('SELECT'):
-                raise ValueError("Only SELECT queries are allowed")
-            def sanitize_sql(sql_query: str) -> str:
-                sql_query = sql_query.strip()
-                # Only keep the first statement (before first ;)
-                if ";" in sql_query:
-                    sql_query = sql_query.split(";")[0]
-                return sql_query
+        # Generate SQL using Ollama
+        generated_text = ""
+        async for token in self._stream_sql_with_ollama(natural_query):
+            generated_text += token
+            yield "token", token
+        sql_query = _extract_sql_query(generated_text)
         
-            sql_query_sanitized = sanitize_sql(sql_query)
-            cursor.execute(sql_query_sanitized)
-            rows = cursor.fetchall()
-            
-            # Convert to list of dictionaries
-            results = [dict(row) for row in rows]
-            
-            return results, len(results)
-            
-        except Exception as e:
-            logger.error(f"SQL execution error: {e}")
-            raise HTTPException(status_code=400, detail=f"SQL execution failed: {str(e)}")
+        def on_success():
+            # Only cache SQL that executed successfully
+            if embedding is not None:
+                self.intent_cache.add(embedding, natural_query, sql_query, schema_version)
         
-        finally:
-            conn.close()
+        yield "sql", (sql_query, on_success)
     
-    def _generate_explanation(self, natural_query: str, sql_query: str, results: List[Dict]) -> str:
-        """Generate a plain-text explanation of the query and results (no markdown code block)"""
-        explanation = f"I converted your question '{natural_query}' into the following SQL query:\n\n"
-        explanation += sql_query + "\n\n"
-        explanation += f"This query returned {len(results)} rows.\n"
-        if results:
-            explanation += "It likely selects, filters, and aggregates data as per your question.\n"
-        return explanation
+    async def _resolve_sql(self, natural_query: str) -> tuple:
+        """Return (sql_query, on_success) from the intent cache or the model"""
+        async for kind, value in self._resolve_sql_tokens(natural_query):
+            if kind == "sql":
+                resolved = value
+        return resolved
+    
+    async def _execute_resolved(self, execute, sql_query: str, on_success) -> tuple:
+        """Run an _execute_sql_query* method off the event loop, then report success to the cache"""
+        result = await asyncio.to_thread(execute, sql_query)
+        on_success()
+        return result
     
     async def process_query(self, natural_query: str) -> QueryResponse:
         """Main method to process natural language query"""
-        import time
         start_time = time.time()
         
         try:
-            # Generate SQL using Ollama
-            sql_query = self._generate_sql_with_ollama(natural_query)
+            sql_query, on_success = await self._resolve_sql(natural_query)
             
             # Execute the query
-            results, row_count = self._execute_sql_query(sql_query)
+            results, row_count = await self._execute_resolved(self._execute_sql_query, sql_query, on_success)
             
             # Generate explanation
-            explanation = self._generate_explanation(natural_query, sql_query, results)
+            explanation = self._generate_explanation(natural_query, sql_query, row_count)
             
             execution_time = time.time() - start_time
             
@@ -236,9 +668,74 @@ SQL Query:"""
                 execution_time=execution_time
             )
             
+        except HTTPException:
+            # Already carries the right status (e.g. 400 for failing SQL)
+            raise
+        except Exception as e:
+            logger.error(f"Query processing error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    async def process_query_arrow(self, natural_query: str) -> bytes:
+        """Process natural language query and return results as an Arrow IPC stream"""
+        start_time = time.time()
+        
+        try:
+            sql_query, on_success = await self._resolve_sql(natural_query)
+            table, row_count = await self._execute_resolved(self._execute_sql_query_arrow, sql_query, on_success)
+            
+            # Non-tabular fields of QueryResponse travel as schema metadata
+            table = table.replace_schema_metadata({
+                "sql_query": sql_query,
+                "explanation": self._generate_explanation(natural_query, sql_query, row_count),
+                "row_count": str(row_count),
+                "execution_time": str(time.time() - start_time),
+            })
+            
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes()
+            
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Query processing error: {e}")
             raise HTTPException(status_code=500, detail=str(e))
+    
+    async def process_query_stream(self, natural_query: str) -> AsyncIterator[str]:
+        """Process a natural language query, streaming progress as server-sent events"""
+        start_time = time.time()
+        
+        try:
+            # Forward tokens to the client as the model generates them
+            async for kind, value in self._resolve_sql_tokens(natural_query):
+                if kind == "token":
+                    yield _sse_event("token", json.dumps({"token": value}))
+                else:
+                    sql_query, on_success = value
+            
+            yield _sse_event("sql", json.dumps({"sql_query": sql_query}))
+            
+            results, row_count = await self._execute_resolved(self._execute_sql_query, sql_query, on_success)
+            
+            response = QueryResponse(
+                sql_query=sql_query,
+                results=results,
+                explanation=self._generate_explanation(natural_query, sql_query, row_count),
+                row_count=row_count,
+                execution_time=time.time() - start_time
+            )
+            yield _sse_event("result", response.model_dump_json())
+            
+        except HTTPException as e:
+            yield _sse_event("error", json.dumps({"detail": e.detail}))
+        except Exception as e:
+            logger.error(f"Query processing error: {e}")
+            yield _sse_event("error", json.dumps({"detail": str(e)}))
+
+def _sse_event(event: str, data: str) -> str:
+    """Format a single server-sent event"""
+    return f"event: {event}\ndata: {data}\n\n"
 
 # Initialize the query engine
 query_engine = QueryGPTEngine()
@@ -248,6 +745,17 @@ async def process_query(request: QueryRequest):
     """Process natural language query and return SQL results"""
     return await query_engine.process_query(request.query)
 
+@app.post("/api/query_arrow")
+async def process_query_arrow(request: QueryRequest):
+    """Process natural language query and return results as an Apache Arrow stream"""
+    content = await query_engine.process_query_arrow(request.query)
+    return Response(content=content, media_type="application/vnd.apache.arrow.stream")
+
+@app.post("/api/query/stream")
+async def process_query_stream(request: QueryRequest):
+    """Stream generated SQL tokens followed by the query results as server-sent events"""
+    return StreamingResponse(query_engine.process_query_stream(request.query), media_type="text/event-stream")
+
 @app.get("/api/schema")
 async def get_schema():
     """Return database schema information"""
@@ -256,7 +764,11 @@ async def get_schema():
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": "2024-01-01T00:00:00Z"}
+    return {
+        "status": "healthy",
+        "timestamp": "2024-01-01T00:00:00Z",
+        "model_loaded": await query_engine.is_model_loaded()
+    }
 
 if __name__ == "__main__":
     import uvicorn
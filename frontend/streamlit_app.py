@@ -1,7 +1,9 @@
 # frontend/streamlit_app.py
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import json
@@ -55,42 +57,87 @@ if 'query_history' not in st.session_state:
 if 'backend_url' not in st.session_state:
     st.session_state.backend_url = "http://localhost:8000"
 
-def check_backend_health():
+EXAMPLE_QUERIES = (
+    "Show me all customers from the USA",
+    "What are the top 5 products by revenue?",
+    "How many orders were completed last month?",
+    "Which customers have spent the most money?",
+    "What's the average order value by country?"
+)
+
+# Larger results are sampled before charting to keep the Plotly payload small
+MAX_CHART_ROWS = 100000
+
+@st.cache_resource
+def get_http_session():
+    """Shared HTTP session so reruns reuse keep-alive connections to the backend"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=5)
+def check_backend_health(backend_url):
     """Check if backend service is running"""
     try:
-        response = requests.get(f"{st.session_state.backend_url}/api/health", timeout=5)
+        response = get_http_session().get(f"{backend_url}/api/health", timeout=5)
         return response.status_code == 200
     except:
         return False
 
-def get_database_schema():
+@st.cache_data(ttl=60)
+def get_database_schema(backend_url):
     """Fetch database schema from backend"""
     try:
-        response = requests.get(f"{st.session_state.backend_url}/api/schema", timeout=10)
+        response = get_http_session().get(f"{backend_url}/api/schema", timeout=10)
         if response.status_code == 200:
             return response.json()['schema']
         return "Schema not available"
     except:
         return "Failed to fetch schema"
 
-def execute_query(natural_query):
-    """Send query to backend and return results"""
+def execute_query(natural_query, sql_placeholder):
+    """Send query to backend, streaming generated SQL into the placeholder, and return results"""
     try:
         payload = {
             "query": natural_query,
             "user_id": "streamlit_user"
         }
         
-        response = requests.post(
-            f"{st.session_state.backend_url}/api/query",
+        # Closing the response returns its connection to the shared session's pool
+        with get_http_session().post(
+            f"{st.session_state.backend_url}/api/query/stream",
             json=payload,
+            stream=True,
             timeout=120  # Increased timeout for local LLM processing
-        )
+        ) as response:
+            if response.status_code != 200:
+                st.error(f"Backend error: {response.status_code} - {response.text}")
+                return None
+            
+            # Parse server-sent events as they arrive
+            generated_text = ""
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "token":
+                        generated_text += data["token"]
+                        sql_placeholder.code(generated_text, language='sql')
+                    elif event == "sql":
+                        sql_placeholder.code(data["sql_query"], language='sql')
+                    elif event == "result":
+                        sql_placeholder.empty()
+                        return data
+                    elif event == "error":
+                        sql_placeholder.empty()
+                        st.error(f"Backend error: {data['detail']}")
+                        return None
         
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Backend error: {response.status_code} - {response.text}")
+            st.error("Backend closed the connection before returning results")
             return None
             
     except requests.exceptions.Timeout:
@@ -100,14 +147,25 @@ def execute_query(natural_query):
         st.error(f"Connection error: {str(e)}")
         return None
 
+def select_example_query(query):
+    """Button callback that fills the query box with an example"""
+    st.session_state.current_query = query
+
 def create_visualization(df, query_result):
     """Create appropriate visualization based on data"""
     if df.empty:
         return None
     
-    # Simple heuristics for chart type selection
-    numeric_columns = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
-    categorical_columns = df.select_dtypes(include=['object']).columns.tolist()
+    if len(df) > MAX_CHART_ROWS:
+        df = df.sample(n=MAX_CHART_ROWS, random_state=0)
+    
+    # Simple heuristics for chart type selection, from a single pass over the dtypes
+    dtypes = df.dtypes.values
+    columns = df.columns.values
+    numeric_mask = np.array([pd.api.types.is_numeric_dtype(t) for t in dtypes], dtype=bool)
+    object_mask = np.array([pd.api.types.is_string_dtype(t) for t in dtypes], dtype=bool)
+    numeric_columns = columns[numeric_mask].tolist()
+    categorical_columns = columns[object_mask & ~numeric_mask].tolist()
     
     if len(numeric_columns) >= 1 and len(categorical_columns) >= 1:
         # Bar chart for categorical vs numeric data
@@ -139,7 +197,7 @@ with st.sidebar:
     st.header("🔧 System Status")
     
     # Backend health check
-    if check_backend_health():
+    if check_backend_health(st.session_state.backend_url):
         st.success("✅ Backend Service Running")
     else:
         st.error("❌ Backend Service Offline")
@@ -154,21 +212,12 @@ with st.sidebar:
     
     st.header("📊 Database Schema")
     with st.expander("View Schema", expanded=False):
-        schema_info = get_database_schema()
+        schema_info = get_database_schema(st.session_state.backend_url)
         st.text(schema_info)
     
     st.header("💡 Example Queries")
-    example_queries = [
-        "Show me all customers from the USA",
-        "What are the top 5 products by revenue?",
-        "How many orders were completed last month?",
-        "Which customers have spent the most money?",
-        "What's the average order value by country?"
-    ]
-    
-    for query in example_queries:
-        if st.button(query, key=f"example_{hash(query)}"):
-            st.session_state.current_query = query
+    for i, query in enumerate(EXAMPLE_QUERIES):
+        st.button(query, key=f"example_{i}", on_click=select_example_query, args=(query,))
 
 # Main query interface
 col1, col2 = st.columns([3, 1])
@@ -190,7 +239,8 @@ with col2:
 # Process query
 if execute_button and query_input.strip():
     with st.spinner("🤖 Processing your query with local AI..."):
-        result = execute_query(query_input.strip())
+        sql_placeholder = st.empty()
+        result = execute_query(query_input.strip(), sql_placeholder)
         
         if result:
             # Store in history